@@ -1,8 +1,26 @@
 import argparse
+import codecs
+import collections
+import concurrent.futures
+import io
+import itertools
 import os
 import sys
+import threading
 import glob
 import fnmatch
+import functools
+import re
+
+try:
+    import hyperscan
+except ImportError:  # Optional, gitignore matching falls back to the re module
+    hyperscan = None
+
+try:
+    import re2
+except ImportError:  # Optional, gitignore matching falls back to the re module
+    re2 = None
 
 # Heuristic to skip common binary file types
 BINARY_EXTENSIONS = {
@@ -73,6 +91,20 @@ ALWAYS_IGNORE_FILENAMES = {
     ".DS_Store",
 }
 
+# Files are read in chunks of this size so binary files can be rejected early
+READ_CHUNK_SIZE = 64 * 1024
+
+# Files larger than this are skipped without being opened (stray dumps, logs...)
+MAX_FILE_BYTES = 2 * 1024 * 1024
+
+# Hyperscan has a fixed per-scan cost that only pays off against large unions;
+# smaller buckets are matched faster by re (measured: re wins below a few
+# hundred globs, whatever the size of the repository)
+HYPERSCAN_MIN_GLOBS = 300
+
+# Verbose skip messages are written to stderr in batches of this many lines
+VERBOSE_LOG_BATCH_SIZE = 1000
+
 
 def get_language_from_extension(filepath):
     """
@@ -120,10 +152,41 @@ def get_language_from_extension(filepath):
     return lang_map.get(ext, "")
 
 
+def read_text_file(filepath_abs):
+    """
+    Reads a UTF-8 text file in fixed-size chunks, stopping early if it looks binary.
+    Returns a `(content, skip_reason)` tuple; `content` is None when the file
+    was skipped. Raises UnicodeDecodeError if the file is not valid UTF-8.
+    """
+    decoder = io.IncrementalNewlineDecoder(
+        codecs.getincrementaldecoder("utf-8")(), translate=True
+    )
+    parts = []
+    total_chars = 0
+    replacement_chars = 0
+    with open(filepath_abs, "rb") as f:
+        chunk = f.read(READ_CHUNK_SIZE)
+        # Same heuristic as git and grep: text files don't contain null bytes
+        if b"\x00" in chunk:
+            return None, "binary"
+        while chunk:
+            text = decoder.decode(chunk)
+            parts.append(text)
+            total_chars += len(text)
+            replacement_chars += text.count("\ufffd")
+            # Text files with too many replacement characters (bad decoding)
+            if replacement_chars > total_chars * 0.1 and total_chars > 100:
+                return None, "replacement"
+            chunk = f.read(READ_CHUNK_SIZE)
+    parts.append(decoder.decode(b"", final=True))
+    return "".join(parts), None
+
+
 def load_gitignore_patterns(gitignore_path):
     """
     Loads patterns from a .gitignore file.
     Strips comments and empty lines.
+    Returns the patterns compiled by `compile_gitignore_patterns`.
     """
     patterns = []
     if os.path.isfile(gitignore_path):
@@ -132,191 +195,537 @@ def load_gitignore_patterns(gitignore_path):
                 line = line.strip()
                 if line and not line.startswith("#"):
                     patterns.append(line)
-    return patterns
+    return compile_gitignore_patterns(patterns)
 
 
-def is_file_ignored(filepath_abs, project_root_abs, gitignore_patterns_by_dir):
+def compile_gitignore_patterns(patterns):
     """
-    Checks if a file should be ignored based on .gitignore patterns.
-    This is a simplified implementation.
-    - `filepath_abs`: Absolute path to the file.
-    - `project_root_abs`: Absolute path to the project root (where global .gitignore might be).
-    - `gitignore_patterns_by_dir`: Dict mapping directory path to its gitignore patterns.
+    Sorts .gitignore patterns into buckets and compiles each bucket once.
+    Returns an `(ignore_rules, negation_rules)` tuple; each is a
+    `(name_regex, path_regex, dir_prefixes)` tuple, see `match_gitignore_rules`.
+    """
+    buckets = {
+        False: {"name": [], "path": [], "dir": []},
+        True: {"name": [], "path": [], "dir": []},
+    }
+    for pattern in patterns:
+        is_negation = pattern.startswith("!")
+        if is_negation:
+            pattern = pattern[1:]
+
+        # Pattern rules for .gitignore:
+        # 1. "dir": pattern ends with '/', it only matches directories.
+        # 2. "name": pattern contains no '/', it matches name in any subdir.
+        # 3. "path": a path relative to .gitignore file's location.
+        if pattern.endswith("/"):
+            buckets[is_negation]["dir"].append(pattern)
+        elif "/" not in pattern:
+            buckets[is_negation]["name"].append(pattern)
+        else:
+            buckets[is_negation]["path"].append(pattern)
+
+    def compile_union(globs):
+        # fnmatch.translate output is self-contained, so the globs can be
+        # joined into a single alternation and matched in one call.
+        if not globs:
+            return None
+        if hyperscan is not None and len(globs) >= HYPERSCAN_MIN_GLOBS:
+            try:
+                return HyperscanGlobUnion(globs)
+            except hyperscan.error:
+                pass  # Unsupported by Hyperscan, try the next engine
+        # Installing RE2 trades speed for guaranteed linear-time matching
+        if re2 is not None:
+            try:
+                return Re2GlobUnion(globs)
+            except re2.error:
+                pass  # Unsupported by RE2, use re for this bucket
+        return re.compile("|".join(fnmatch.translate(g) for g in globs))
+
+    return tuple(
+        (
+            compile_union(buckets[is_negation]["name"]),
+            compile_union(buckets[is_negation]["path"]),
+            tuple(sorted(buckets[is_negation]["dir"])),
+        )
+        for is_negation in (False, True)
+    )
+
+
+def glob_to_regex(pattern):
     """
-    if os.path.basename(filepath_abs) in ALWAYS_IGNORE_FILENAMES:
-        return True
+    Translates a shell glob into a regex, like fnmatch.translate, but returns
+    only the pattern body: no anchors, inline flags or atomic groups, which
+    regex engines other than `re` may not support.
+    """
+    i, n = 0, len(pattern)
+    res = []
+    while i < n:
+        c = pattern[i]
+        i += 1
+        if c == "*":
+            # Collapse runs of '*'
+            while i < n and pattern[i] == "*":
+                i += 1
+            res.append(".*")
+        elif c == "?":
+            res.append(".")
+        elif c == "[":
+            j = i
+            if j < n and pattern[j] == "!":
+                j += 1
+            if j < n and pattern[j] == "]":
+                j += 1
+            while j < n and pattern[j] != "]":
+                j += 1
+            if j >= n:
+                res.append("\\[")
+            else:
+                stuff = pattern[i:j].replace("\\", "\\\\")
+                stuff = re.sub(r"([&~|])", r"\\\1", stuff)
+                i = j + 1
+                if stuff[0] == "!":
+                    stuff = "^" + stuff[1:]
+                elif stuff[0] in ("^", "["):
+                    stuff = "\\" + stuff
+                res.append(f"[{stuff}]")
+        else:
+            res.append(re.escape(c))
+    return "".join(res)
+
+
+def stop_at_first_match(pattern_id, start, end, flags, context):
+    """
+    Hyperscan match handler: one match is enough, so stop scanning.
+    """
+    return True
+
 
-    # Always ignore .git directory contents
-    # Check if filepath_abs is inside any .git directory
-    path_parts = filepath_abs.split(os.sep)
-    if ".git" in path_parts:
-        # More precise check: ensure '.git' is a directory component, not part of a filename
+class HyperscanGlobUnion:
+    """
+    A bucket of globs compiled into a single Hyperscan database, so a path is
+    checked against all of them in one scan. Only used when the optional
+    `hyperscan` package is installed, for buckets of at least
+    `HYPERSCAN_MIN_GLOBS` globs; mirrors the `match` method of the
+    compiled `re` union it replaces.
+    """
+
+    def __init__(self, globs):
+        self._database = hyperscan.Database()
+        self._database.compile(
+            expressions=[f"\\A(?:{glob_to_regex(g)})\\z".encode() for g in globs],
+            ids=list(range(len(globs))),
+            elements=len(globs),
+            flags=[
+                hyperscan.HS_FLAG_DOTALL
+                | hyperscan.HS_FLAG_SINGLEMATCH
+                | hyperscan.HS_FLAG_UTF8
+            ]
+            * len(globs),
+        )
+        # Paths that can't be encoded as UTF-8 (undecodable names) use re
+        # instead; that regex is only compiled once such a path shows up.
+        self._globs = globs
+        self._regex = None
+        # Scratch space can't be shared between threads
+        self._local = threading.local()
+
+    def match(self, subject):
         try:
-            git_index = path_parts.index(".git")
-            git_dir_path = os.sep.join(path_parts[: git_index + 1])
-            if os.path.isdir(git_dir_path) and filepath_abs.startswith(
-                git_dir_path + os.sep
-            ):
-                return True
-        except ValueError:
-            pass  # .git not in path
+            data = subject.encode("utf-8")
+        except UnicodeEncodeError:
+            if self._regex is None:
+                self._regex = re.compile(
+                    "|".join(fnmatch.translate(g) for g in self._globs)
+                )
+            return self._regex.match(subject)
+
+        scratch = getattr(self._local, "scratch", None)
+        if scratch is None:
+            scratch = self._local.scratch = hyperscan.Scratch(self._database)
+
+        try:
+            self._database.scan(
+                data, match_event_handler=stop_at_first_match, scratch=scratch
+            )
+        except hyperscan.ScanTerminated:
+            return True
+        return None
+
+
+class Re2GlobUnion:
+    """
+    A bucket of globs compiled into a single RE2 regex. Only used when the
+    optional `google-re2` package is installed. It is slower than `re` for
+    typical buckets, but RE2 guarantees linear-time matching, so adversarial
+    file names can't make the `.*` of a glob backtrack. Mirrors the `match`
+    method of the compiled `re` union it replaces.
+    """
 
-    current_dir = os.path.dirname(filepath_abs)
+    def __init__(self, globs):
+        # Globs RE2 can't parse fall back to re; don't let RE2 log them too
+        options = re2.Options()
+        options.log_errors = False
+        self._regex = re2.compile(
+            "(?s:" + "|".join(glob_to_regex(g) for g in globs) + ")\\z", options
+        )
+        # Paths that can't be encoded as UTF-8 (undecodable names) use re
+        # instead; that regex is only compiled once such a path shows up.
+        self._globs = globs
+        self._fallback_regex = None
+
+    def match(self, subject):
+        try:
+            return self._regex.match(subject)
+        except UnicodeEncodeError:
+            if self._fallback_regex is None:
+                self._fallback_regex = re.compile(
+                    "|".join(fnmatch.translate(g) for g in self._globs)
+                )
+            return self._fallback_regex.match(subject)
+
+
+def match_gitignore_rules(rules, path_relative, name, is_dir):
+    """
+    Checks one bucket of compiled rules from `compile_gitignore_patterns`.
+    - `path_relative`: Path relative to the .gitignore's directory, '/'-separated.
+    - `name`: Basename of the path.
+    - `is_dir`: Whether the path is a directory; "dir" rules only match those.
+    """
+    name_regex, path_regex, dir_prefixes = rules
+    return (
+        (name_regex is not None and name_regex.match(name) is not None)
+        or (path_regex is not None and path_regex.match(path_relative) is not None)
+        or (is_dir and (path_relative + "/").startswith(dir_prefixes))
+    )
+
+
+def is_path_excluded(path_abs, is_dir, gitignore_chain):
+    """
+    Checks a single file or directory against the patterns of `gitignore_chain`,
+    a sequence of `(gitignore_dir_prefix_len, compiled_patterns)` pairs, where
+    the prefix length covers the .gitignore's directory and trailing separator.
+    Ancestor directories are not considered here; see `GitignoreMatcher`.
+    """
     ignored = False
-    negated = False  # For handling !pattern
-
-    # Iterate from file's directory up to project root
-    # Rules in .gitignore closer to the file take precedence for the same pattern,
-    # but later rules within the same file for the same path also take precedence.
-    # Negation rules can override ignore rules.
-    # This simplified version checks all ignore patterns first, then negation.
-    # A more correct implementation is complex.
-
-    # Traverse from project root down to file's directory to apply rules hierarchically
-    # This isn't perfect but captures some of the cascading nature.
-    # A better way is to check from file's dir upwards.
-
-    path_components = os.path.relpath(filepath_abs, project_root_abs).split(os.sep)
-
-    # Check against .gitignore in parent directories, starting from project_root
-    # and going down to the file's own directory.
-    # This means patterns in deeper .gitignore files can override those in higher ones
-    # if they match. We will apply them in order.
-
-    # Create a list of relevant .gitignore files from project root down to file's dir.
-    # And then check patterns from the deepest .gitignore first (highest precedence).
-
-    # Path from project root to file, using standard '/' separators
-    filepath_relative_to_project_root = os.path.relpath(
-        filepath_abs, project_root_abs
-    ).replace(os.sep, "/")
-
-    # Check all .gitignore files from the file's directory up to the project root
-    temp_dir = os.path.dirname(filepath_abs)
-    relevant_gitignore_dirs = []
-    while True:
-        if temp_dir in gitignore_patterns_by_dir:
-            relevant_gitignore_dirs.append(temp_dir)
-        if (
-            temp_dir == project_root_abs
-            or not temp_dir
-            or temp_dir == os.path.dirname(temp_dir)
+
+    name = path_abs.rpartition(os.sep)[2]
+    for gitignore_dir_prefix_len, (ignore_rules, negation_rules) in gitignore_chain:
+        # Path relative to the directory containing the current .gitignore file.
+        # Every directory in the chain is an ancestor, so slicing is enough.
+        path_relative_to_gitignore_dir = path_abs[gitignore_dir_prefix_len:].replace(
+            os.sep, "/"
+        )
+
+        # A matching `!` rule anywhere in the chain un-ignores the path.
+        if match_gitignore_rules(
+            negation_rules, path_relative_to_gitignore_dir, name, is_dir
         ):
-            break
-        temp_dir = os.path.dirname(temp_dir)
-
-    # Process patterns from most specific (.gitignore in same dir) to least specific (project root)
-    for gitignore_dir_abs in relevant_gitignore_dirs:
-        patterns = gitignore_patterns_by_dir[gitignore_dir_abs]
-        # Path relative to the directory containing the current .gitignore file
-        path_relative_to_gitignore_dir = os.path.relpath(
-            filepath_abs, gitignore_dir_abs
-        ).replace(os.sep, "/")
-
-        for pattern in patterns:
-            is_negation = pattern.startswith("!")
-            if is_negation:
-                pattern = pattern[1:]
-
-            # fnmatch pattern rules for .gitignore:
-            # 1. If pattern ends with '/', it only matches directories.
-            #    We match if path_relative_to_gitignore_dir starts with pattern.
-            # 2. If pattern contains no '/', it matches name in any subdir.
-            #    fnmatch(os.path.basename(path_relative_to_gitignore_dir), pattern)
-            # 3. Otherwise, it's a path relative to .gitignore file's location.
-            #    fnmatch(path_relative_to_gitignore_dir, pattern)
-
-            matched = False
-            if pattern.endswith("/"):
-                # Directory pattern
-                # e.g. "logs/" should match "logs/error.txt"
-                # path_relative_to_gitignore_dir must be "logs/error.txt"
-                # pattern.rstrip('/') would be "logs"
-                if (path_relative_to_gitignore_dir + "/").startswith(pattern):
-                    matched = True
-            elif "/" not in pattern:
-                # File/dir name pattern, matches at any level relative to .gitignore
-                # For a file: check its basename
-                if fnmatch.fnmatch(
-                    os.path.basename(path_relative_to_gitignore_dir), pattern
-                ):
-                    matched = True
-                # For a directory: check if any path component matches
-                # This is harder; git's behavior is that 'foo' matches 'foo' and 'foo/bar'
-                # If path_relative_to_gitignore_dir is 'a/foo/b.txt' and pattern 'foo'
-                # This is complicated. fnmatch alone isn't enough for full "match anywhere" semantics of plain names.
-                # Let's simplify: if it's a plain name, also check if the path starts with it as a directory.
-                if fnmatch.fnmatch(
-                    path_relative_to_gitignore_dir, pattern + "/*"
-                ) or fnmatch.fnmatch(path_relative_to_gitignore_dir, pattern):
-                    matched = True
-            else:
-                # Path pattern relative to .gitignore file's directory
-                if fnmatch.fnmatch(path_relative_to_gitignore_dir, pattern):
-                    matched = True
-
-            if matched:
-                if is_negation:
-                    negated = True  # This file is specifically un-ignored
-                    ignored = False  # Reset ignore status if previously ignored by a broader rule
-                elif (
-                    not negated
-                ):  # Only ignore if not specifically un-ignored by a later rule
-                    ignored = True
-                    # If a deeper .gitignore's !rule un-ignored it, a shallower ignore rule shouldn't re-ignore it
-                    # This logic needs refinement for perfect precedence.
-                    # For now, if any rule ignores it, and no specific negation for THIS rule match, it's ignored.
-                    # If a negation rule matches, it becomes unignored.
-
-    # Final decision based on whether it was last ignored or unignored.
-    # If `negated` is true, it means a `!` rule was the last one to match for this file.
-    return ignored if not negated else False
-
-
-def collect_gitignore_patterns(start_paths_abs, project_root_abs):
-    """
-    Collects all .gitignore patterns from project_root and any .gitignore
-    found within the directory trees of start_paths_abs.
-    Returns a dict: {absolute_dir_path: [patterns]}
-    """
-    patterns_by_dir = {}
-
-    # First, load .gitignore from project_root if it exists
-    root_gitignore_path = os.path.join(project_root_abs, ".gitignore")
-    if os.path.isfile(root_gitignore_path):
-        patterns_by_dir[project_root_abs] = load_gitignore_patterns(root_gitignore_path)
-
-    # Then, search for .gitignore files in the specified paths and their subdirectories
-    # Use a set to avoid processing the same .gitignore multiple times
-    # if start_paths_abs overlap.
-    gitignores_found = (
-        {root_gitignore_path} if os.path.isfile(root_gitignore_path) else set()
+            return False
+        if not ignored:
+            ignored = match_gitignore_rules(
+                ignore_rules, path_relative_to_gitignore_dir, name, is_dir
+            )
+
+    return ignored
+
+
+@functools.lru_cache(maxsize=None)
+def ancestors(dir_abs):
+    """
+    Returns `dir_abs` followed by each of its parent directories, up to the
+    filesystem root. Cached, so each directory's chain is only built once.
+    """
+    parent_dir_abs = os.path.dirname(dir_abs)
+    if not dir_abs or parent_dir_abs == dir_abs:
+        return (dir_abs,)
+    return (dir_abs,) + ancestors(parent_dir_abs)
+
+
+class GitignoreMatcher:
+    """
+    Decides whether files are ignored by the .gitignore files of a project.
+    - `project_root_abs`: Absolute path to the project root (where global .gitignore might be).
+
+    .gitignore files are loaded lazily, the first time a directory is looked at,
+    so only directories that are actually traversed are read. Only directories
+    at or below the project root have their .gitignore files considered.
+    Lookups are cached per directory: the chain of relevant .gitignore files and
+    whether the directory itself is ignored are computed once, so checking a file
+    only has to look at the file's own name and path.
+    As in git, a file inside an ignored directory cannot be re-included by a `!` rule.
+    """
+
+    def __init__(self, project_root_abs):
+        self.project_root_abs = project_root_abs
+        self._project_root_prefix = os.path.join(project_root_abs, "")
+        # {absolute_dir_path: compiled_patterns, or None if it has no .gitignore}
+        self.gitignore_patterns_by_dir = {}
+        self._dir_chain = functools.lru_cache(maxsize=None)(self._dir_chain)
+        self._dir_ignored = functools.lru_cache(maxsize=None)(self._dir_ignored)
+
+    def dir_patterns(self, dir_abs, has_gitignore=None):
+        """
+        Returns the compiled patterns of the .gitignore in `dir_abs`, or None if
+        there is none, loading it on first use.
+        `has_gitignore` can be passed by callers that already listed the
+        directory, to save a stat.
+        """
+        try:
+            return self.gitignore_patterns_by_dir[dir_abs]
+        except KeyError:
+            pass
+        patterns = None
+        if dir_abs == self.project_root_abs or dir_abs.startswith(
+            self._project_root_prefix
+        ):
+            gitignore_path = os.path.join(dir_abs, ".gitignore")
+            if has_gitignore is None:
+                has_gitignore = os.path.isfile(gitignore_path)
+            if has_gitignore:
+                patterns = load_gitignore_patterns(gitignore_path)
+        # Several threads may load the same file; the results are identical
+        return self.gitignore_patterns_by_dir.setdefault(dir_abs, patterns)
+
+    def _dir_chain(self, dir_abs):
+        """
+        Returns the `(gitignore_dir_prefix_len, compiled_patterns)` pairs that apply
+        to entries of `dir_abs`, from `dir_abs` itself up to the project root.
+        """
+        chain = []
+        for ancestor_abs in ancestors(dir_abs):
+            patterns = self.dir_patterns(ancestor_abs)
+            if patterns is not None:
+                chain.append((len(os.path.join(ancestor_abs, "")), patterns))
+            if ancestor_abs == self.project_root_abs:
+                break
+        return tuple(chain)
+
+    def _dir_ignored(self, dir_abs):
+        """
+        Checks if `dir_abs` or any of its parents (below the project root) is ignored.
+        """
+        dir_ancestors = ancestors(dir_abs)
+        if dir_abs == self.project_root_abs or len(dir_ancestors) == 1:
+            return False
+        parent_dir_abs = dir_ancestors[1]
+        if self._dir_ignored(parent_dir_abs):
+            return True
+        return is_path_excluded(dir_abs, True, self._dir_chain(parent_dir_abs))
+
+    def is_dir_ignored(self, dir_abs):
+        """
+        Checks if a directory, or any directory above it, is ignored.
+        """
+        return self._dir_ignored(dir_abs)
+
+    def is_file_ignored(self, filepath_abs):
+        """
+        Checks if a file should be ignored based on .gitignore patterns.
+        This is a simplified implementation.
+        """
+        # Always ignore .git directory contents (and `.git` files of worktrees
+        # and submodules). A substring check avoids stat'ing the directory.
+        if f"{os.sep}.git{os.sep}" in filepath_abs or filepath_abs.endswith(
+            f"{os.sep}.git"
+        ):
+            return True
+
+        dir_abs = os.path.dirname(filepath_abs)
+        if self._dir_ignored(dir_abs):
+            return True
+        return is_path_excluded(filepath_abs, False, self._dir_chain(dir_abs))
+
+
+def ignored_dir_message(dir_abs, project_root_abs):
+    """
+    Returns the verbose message for a directory left out because of .gitignore.
+    """
+    dir_relative_std = os.path.relpath(dir_abs, project_root_abs).replace(os.sep, "/")
+    return f"Skipping ignored directory (by .gitignore): {dir_relative_std}/"
+
+
+def walk_files(dir_abs, gitignore_matcher=None, log_skip=None):
+    """
+    Yields the absolute path of every file below `dir_abs`, like globbing
+    '<dir>/**/*' would, but without descending into ignored directories.
+    Hidden entries are skipped as glob does, which also keeps `.git` out.
+    `gitignore_matcher` is None when .gitignore processing is disabled;
+    otherwise each directory's .gitignore is loaded as the directory is listed.
+    If given, `log_skip` is called with a message for each directory left out
+    because of .gitignore.
+    """
+    dirs_to_scan = [dir_abs]
+    while dirs_to_scan:
+        current_dir_abs = dirs_to_scan.pop()
+        subdirs_abs = []
+        has_gitignore = False
+        try:
+            with os.scandir(current_dir_abs) as entries:
+                for entry in entries:
+                    if entry.name.startswith("."):
+                        if entry.name == ".gitignore":
+                            has_gitignore = True
+                        continue
+                    if entry.is_dir():
+                        subdirs_abs.append(entry.path)
+                    elif entry.is_file():
+                        yield entry.path
+        except OSError:
+            # Unreadable directories are skipped, as glob does
+            continue
+
+        if gitignore_matcher is None:
+            dirs_to_scan.extend(subdirs_abs)
+            continue
+        # The listing already told whether there is a .gitignore, and it must
+        # be loaded before the subdirectories are checked against it.
+        gitignore_matcher.dir_patterns(current_dir_abs, has_gitignore)
+        for subdir_abs in subdirs_abs:
+            if not gitignore_matcher.is_dir_ignored(subdir_abs):
+                dirs_to_scan.append(subdir_abs)
+            elif log_skip is not None:
+                log_skip(
+                    ignored_dir_message(subdir_abs, gitignore_matcher.project_root_abs)
+                )
+
+
+def filter_candidate(filepath_abs, project_root_prefix, explicitly_ignored_paths_abs):
+    """
+    Applies the checks that don't depend on .gitignore to a candidate file.
+    `project_root_prefix` is the absolute project root with a trailing separator.
+    Returns a `(filepath_relative_std, skip_message)` tuple; `skip_message` is
+    None if the file passed.
+    """
+    # Make path relative to project_root for display and .gitignore logic
+    # Ensure it's truly within project_root for sensible relative paths
+    if not filepath_abs.startswith(project_root_prefix):
+        return None, f"Skipping file outside project root: {filepath_abs}"
+
+    filepath_relative = filepath_abs[len(project_root_prefix) :]
+    # Normalize path separators for cross-platform consistency in output
+    filepath_relative_std = filepath_relative.replace(os.sep, "/")
+
+    # Explicit ignore check (takes precedence)
+    is_explicitly_ignored = False
+    if (
+        filepath_abs in explicitly_ignored_paths_abs
+    ):  # File itself is explicitly ignored
+        is_explicitly_ignored = True
+    else:  # Check if file is within an explicitly ignored directory
+        for ignored_item_abs in explicitly_ignored_paths_abs:
+            if os.path.isdir(ignored_item_abs):
+                # os.path.join ensures correct trailing separator for directory path
+                if filepath_abs.startswith(os.path.join(ignored_item_abs, "")):
+                    is_explicitly_ignored = True
+                    break
+
+    if is_explicitly_ignored:
+        return (
+            filepath_relative_std,
+            f"Skipping explicitly ignored file (by --ignore): {filepath_relative_std}",
+        )
+
+    # Basic binary file check by extension, and files ignored by name.
+    # Sliced by hand rather than with os.path.splitext since this runs per file.
+    filename = filepath_abs.rpartition(os.sep)[2]
+    dot = filename.rfind(".")
+    ext = filename[dot:].lower() if dot > 0 else ""
+    if ext in BINARY_EXTENSIONS:
+        return (
+            filepath_relative_std,
+            f"Skipping likely binary file (by extension): {filepath_relative_std}",
+        )
+    if filename in ALWAYS_IGNORE_FILENAMES:
+        return (
+            filepath_relative_std,
+            f"Skipping ignored file (by always_ignore): {filepath_relative_std}",
+        )
+    return filepath_relative_std, None
+
+
+def render_candidate(filepath_abs, filepath_relative_std, max_file_bytes):
+    """
+    Reads a file that passed filtering and formats it as a Markdown code block.
+    Returns a `(md_block, skip_message)` tuple, as `process_one` does.
+    `max_file_bytes` is None when file size is not limited.
+    """
+    # Size check before opening, so huge files are never read
+    if max_file_bytes is not None and os.stat(filepath_abs).st_size > max_file_bytes:
+        return (
+            None,
+            f"Skipping file larger than {max_file_bytes} bytes: {filepath_relative_std}",
+        )
+
+    try:
+        content, skip_reason = read_text_file(filepath_abs)
+    except UnicodeDecodeError:
+        return (
+            None,
+            f"Skipping file with encoding error (likely binary): {filepath_relative_std}",
+        )
+
+    # Additional check for binary files that might have slipped through extension check
+    if skip_reason == "binary":
+        return (
+            None,
+            f"Skipping likely binary file (contains null bytes): {filepath_relative_std}",
+        )
+    if skip_reason == "replacement":
+        return (
+            None,
+            f"Skipping file with many Unicode replacement characters (likely binary or wrong encoding): {filepath_relative_std}",
+        )
+
+    lang = get_language_from_extension(filepath_relative_std)
+
+    md_block = []
+    md_block.append(f"```{lang} name={filepath_relative_std}")
+    md_block.append(content.strip())  # Strip trailing newlines from content itself
+    md_block.append("```")
+    return "\n".join(md_block), None
+
+
+def process_one(
+    filepath_abs,
+    project_root_prefix,
+    explicitly_ignored_paths_abs,
+    max_file_bytes=MAX_FILE_BYTES,
+):
+    """
+    Filters and reads a single candidate file, without .gitignore processing.
+    Returns a `(md_block, skip_message)` tuple: the Markdown code block for the
+    file, or None and a message explaining why the file was skipped.
+    """
+    filepath_relative_std, skip_message = filter_candidate(
+        filepath_abs, project_root_prefix, explicitly_ignored_paths_abs
     )
+    if skip_message is not None:
+        return None, skip_message
+    return render_candidate(filepath_abs, filepath_relative_std, max_file_bytes)
 
-    dirs_to_scan = set()
-    for p_abs in start_paths_abs:
-        if os.path.isdir(p_abs):
-            dirs_to_scan.add(p_abs)
-        elif os.path.isfile(p_abs):
-            dirs_to_scan.add(os.path.dirname(p_abs))
-
-    for current_search_dir in dirs_to_scan:
-        for root, _, _ in os.walk(current_search_dir):
-            # Ensure we only go as deep as project_root_abs allows if path is outside
-            if not root.startswith(project_root_abs) and project_root_abs not in root:
-                # This case can happen if a start_path is outside project_root_abs
-                # For simplicity, we'll assume start_paths are within or at project_root_abs
-                # or that project_root_abs is the ultimate boundary.
-                pass
-
-            gitignore_path = os.path.join(root, ".gitignore")
-            if (
-                os.path.isfile(gitignore_path)
-                and gitignore_path not in gitignores_found
-            ):
-                patterns_by_dir[root] = load_gitignore_patterns(gitignore_path)
-                gitignores_found.add(gitignore_path)
-    return patterns_by_dir
+
+def process_one_with_gitignore(
+    filepath_abs,
+    project_root_prefix,
+    explicitly_ignored_paths_abs,
+    gitignore_matcher,
+    max_file_bytes=MAX_FILE_BYTES,
+):
+    """
+    Like `process_one`, but also skips files ignored by `gitignore_matcher`.
+    """
+    filepath_relative_std, skip_message = filter_candidate(
+        filepath_abs, project_root_prefix, explicitly_ignored_paths_abs
+    )
+    if skip_message is not None:
+        return None, skip_message
+    if gitignore_matcher.is_file_ignored(filepath_abs):
+        return (
+            None,
+            f"Skipping ignored file (by .gitignore): {filepath_relative_std}",
+        )
+    return render_candidate(filepath_abs, filepath_relative_std, max_file_bytes)
 
 
 def main():
@@ -356,6 +765,13 @@ def main():
         "the current working directory or can be absolute. Explicitly ignored items take "
         "precedence over other inclusion rules.",
     )
+    parser.add_argument(
+        "--max-file-size",
+        type=int,
+        default=MAX_FILE_BYTES,
+        help="Skip files larger than this many bytes without reading them. "
+        f"Use 0 to disable the limit. Default: {MAX_FILE_BYTES}.",
+    )
     parser.add_argument(
         "--verbose",
         "-v",
@@ -366,6 +782,9 @@ def main():
     args = parser.parse_args()
 
     project_root_abs = os.path.abspath(args.project_root)
+    if args.max_file_size < 0:
+        parser.error("--max-file-size must be 0 (no limit) or a positive size")
+    max_file_bytes = args.max_file_size if args.max_file_size > 0 else None
     if args.verbose:
         print(f"Project root set to: {project_root_abs}", file=sys.stderr)
 
@@ -409,8 +828,36 @@ def main():
                     file=sys.stderr,
                 )
 
-    # --- 1. Collect all files based on input paths and globs ---
-    candidate_files_abs = set()
+    # --- 1. Prepare .gitignore matching ---
+    # Created first so ignored directories can be skipped while collecting files.
+    # .gitignore files are loaded as their directories are reached.
+    gitignore_matcher = None
+    if not args.no_gitignore:
+        gitignore_matcher = GitignoreMatcher(project_root_abs)
+    else:
+        if args.verbose:
+            print(
+                "Skipping .gitignore processing due to --no-gitignore.", file=sys.stderr
+            )
+
+    # Verbose skip messages, from collecting and from filtering files, are
+    # buffered and written to stderr in batches
+    skip_log = []
+
+    def flush_skip_log():
+        if skip_log:
+            sys.stderr.write("\n".join(skip_log) + "\n")
+            skip_log.clear()
+
+    def log_skip(message):
+        skip_log.append(message)
+        if len(skip_log) >= VERBOSE_LOG_BATCH_SIZE:
+            flush_skip_log()
+
+    # --- 2. Collect all files based on input paths and globs ---
+    # Kept in traversal order; only deduplicated when the sources can overlap
+    candidate_files_abs = []
+    candidates_may_overlap = len(args.paths) > 1
     for path_arg in args.paths:
         # Ensure path_arg is absolute for consistent globbing if it's relative
         # However, glob works fine with relative paths from CWD.
@@ -418,203 +865,233 @@ def main():
         # Let glob handle it.
 
         # Handle if path_arg is like `.` or `src` vs `src/*`
-        # If it's an existing directory, glob needs a wildcard to go inside.
+        # If it's an existing directory, walk it ourselves so ignored
+        # subdirectories are never descended into.
         path_to_glob = path_arg
         if (
             os.path.isdir(path_arg)
             and not path_arg.endswith(os.sep + "*")
             and not path_arg.endswith(os.sep + "**" + os.sep + "*")
         ):
-            # Add a recursive wildcard to search inside the directory
-            path_to_glob = os.path.join(path_arg, "**", "*")
+            candidate_files_abs.extend(
+                walk_files(
+                    os.path.abspath(path_arg),
+                    gitignore_matcher,
+                    log_skip if args.verbose else None,
+                )
+            )
+            continue
 
         # Use glob to expand patterns and find files
         # recursive=True allows `**` to match directories recursively
-        expanded_paths = glob.glob(path_to_glob, recursive=True)
+        expanded_paths = glob.iglob(path_to_glob, recursive=True)
+        first_path = next(expanded_paths, None)
 
-        if not expanded_paths and os.path.exists(
-            path_arg
-        ):  # Handle single existing file/dir not caught by glob
-            expanded_paths = [path_arg]
+        if first_path is None:
+            if os.path.exists(path_arg):
+                # Handle single existing file/dir not caught by glob
+                expanded_paths = iter([path_arg])
+        else:
+            expanded_paths = itertools.chain([first_path], expanded_paths)
 
+        dirs_to_walk = []
         for item_path in expanded_paths:
             abs_item_path = os.path.abspath(item_path)
             if os.path.isfile(abs_item_path):
-                candidate_files_abs.add(abs_item_path)
-            elif (
-                os.path.isdir(abs_item_path) and path_to_glob == path_arg
-            ):  # if user specified dir explicitly, walk it
-                for root, _, files_in_dir in os.walk(abs_item_path):
-                    for f_name in files_in_dir:
-                        file_path_abs = os.path.abspath(os.path.join(root, f_name))
-                        candidate_files_abs.add(file_path_abs)
+                candidate_files_abs.append(abs_item_path)
+            elif path_to_glob == path_arg and os.path.isdir(
+                abs_item_path
+            ):  # if user's glob matched a dir explicitly, walk it
+                dirs_to_walk.append(abs_item_path)
 
+        # Recursive globs like 'src/**' match every subdirectory as well, so only
+        # walk the outermost ones. Sorting by components keeps each directory
+        # right after its ancestors.
+        # Files matched by the glob itself may be found again while walking
+        if dirs_to_walk:
+            candidates_may_overlap = True
+        walked_dir_prefix = None
+        for dir_abs in sorted(dirs_to_walk, key=lambda p: p.split(os.sep)):
+            if walked_dir_prefix and dir_abs.startswith(walked_dir_prefix):
+                continue
+            walked_dir_prefix = os.path.join(dir_abs, "")
+            if gitignore_matcher is not None and gitignore_matcher.is_dir_ignored(
+                dir_abs
+            ):
+                if args.verbose:
+                    log_skip(ignored_dir_message(dir_abs, project_root_abs))
+                continue
+            for root, dirs_in_dir, files_in_dir in os.walk(dir_abs):
+                for f_name in files_in_dir:
+                    candidate_files_abs.append(os.path.join(root, f_name))
+                if gitignore_matcher is None:
+                    continue
+                # os.walk already listed the directory, no need to stat for
+                # .gitignore; it must be loaded before the subdirectories are
+                # checked against it. Ignored subdirectories are pruned in
+                # place, so os.walk never descends into them.
+                gitignore_matcher.dir_patterns(root, ".gitignore" in files_in_dir)
+                kept_dirs = []
+                for d_name in dirs_in_dir:
+                    subdir_abs = os.path.join(root, d_name)
+                    if not gitignore_matcher.is_dir_ignored(subdir_abs):
+                        kept_dirs.append(d_name)
+                    elif args.verbose:
+                        log_skip(ignored_dir_message(subdir_abs, project_root_abs))
+                dirs_in_dir[:] = kept_dirs
+
+    if candidates_may_overlap:
+        # dict.fromkeys drops duplicates but, unlike a set, keeps the order
+        candidate_files_abs = list(dict.fromkeys(candidate_files_abs))
+
+    flush_skip_log()  # Directories skipped while collecting, before stage 3
     if args.verbose:
+        if gitignore_matcher is not None:
+            found_gitignores = sum(
+                patterns is not None
+                for patterns in gitignore_matcher.gitignore_patterns_by_dir.values()
+            )
+            print(
+                f"Loaded .gitignore patterns from {found_gitignores} .gitignore file(s) while collecting files.",
+                file=sys.stderr,
+            )
         print(
             f"Found {len(candidate_files_abs)} candidate files before filtering.",
             file=sys.stderr,
         )
 
-    # --- 2. Load .gitignore patterns ---
-    gitignore_patterns_by_dir = {}
-    if not args.no_gitignore:
-        start_paths_for_gitignore_search_abs = [os.path.abspath(p) for p in args.paths]
-        gitignore_patterns_by_dir = collect_gitignore_patterns(
-            start_paths_for_gitignore_search_abs, project_root_abs
-        )
-        if args.verbose:
-            found_gitignores = len(gitignore_patterns_by_dir)
-            print(
-                f"Loaded .gitignore patterns from {found_gitignores} .gitignore file(s).",
-                file=sys.stderr,
-            )
-            # for d, pats in gitignore_patterns_by_dir.items():
-            #     print(f"  {os.path.relpath(d, project_root_abs)}: {len(pats)} patterns", file=sys.stderr)
-    else:
-        if args.verbose:
-            print(
-                "Skipping .gitignore processing due to --no-gitignore.", file=sys.stderr
-            )
-
-    # --- 3. Filter files ---
-    processed_files_content = []
-    processed_files_paths_relative = []
+    # --- 3. Filter and read files, writing each block as soon as it is ready ---
+    processed_files_count = 0
 
     # Sort for consistent output order
-    sorted_candidate_files_abs = sorted(list(candidate_files_abs))
-
-    for filepath_abs in sorted_candidate_files_abs:
-        # Make path relative to project_root for display and .gitignore logic
-        # Ensure it's truly within project_root for sensible relative paths
-        if not filepath_abs.startswith(project_root_abs):
-            if args.verbose:
-                print(
-                    f"Skipping file outside project root: {filepath_abs}",
-                    file=sys.stderr,
-                )
-            continue
-
-        filepath_relative = os.path.relpath(filepath_abs, project_root_abs)
-        # Normalize path separators for cross-platform consistency in output
-        filepath_relative_std = filepath_relative.replace(os.sep, "/")
-
-        # Explicit ignore check (takes precedence)
-        is_explicitly_ignored = False
-        if (
-            filepath_abs in explicitly_ignored_paths_abs
-        ):  # File itself is explicitly ignored
-            is_explicitly_ignored = True
-        else:  # Check if file is within an explicitly ignored directory
-            for ignored_item_abs in explicitly_ignored_paths_abs:
-                if os.path.isdir(ignored_item_abs):
-                    # os.path.join ensures correct trailing separator for directory path
-                    if filepath_abs.startswith(os.path.join(ignored_item_abs, "")):
-                        is_explicitly_ignored = True
-                        break
-
-        if is_explicitly_ignored:
-            if args.verbose:
-                print(
-                    f"Skipping explicitly ignored file (by --ignore): {filepath_relative_std}",
-                    file=sys.stderr,
-                )
-            continue
-
-        # Basic binary file check by extension
-        if os.path.splitext(filepath_abs)[1].lower() in BINARY_EXTENSIONS:
-            if args.verbose:
-                print(
-                    f"Skipping likely binary file (by extension): {filepath_relative_std}",
-                    file=sys.stderr,
-                )
-            continue
-
-        # .gitignore check (includes ALWAYS_IGNORE_FILENAMES)
-        if not args.no_gitignore and is_file_ignored(
-            filepath_abs, project_root_abs, gitignore_patterns_by_dir
-        ):
-            if args.verbose:
-                print(
-                    f"Skipping ignored file (by .gitignore or always_ignore): {filepath_relative_std}",
-                    file=sys.stderr,
-                )
-            continue
-
-        try:
-            with open(filepath_abs, "r", encoding="utf-8") as f:
-                content = f.read()
-
-            # Additional check for binary files that might have slipped through extension check
-            # or text files with too many replacement characters (bad decoding)
-            if (
-                content.count("\ufffd") > len(content) * 0.1 and len(content) > 100
-            ):  # Heuristic
-                if args.verbose:
-                    print(
-                        f"Skipping file with many Unicode replacement characters (likely binary or wrong encoding): {filepath_relative_std}",
-                        file=sys.stderr,
-                    )
-                continue
-
-            lang = get_language_from_extension(filepath_relative_std)
-
-            md_block = []
-            md_block.append(f"```{lang} name={filepath_relative_std}")
-            md_block.append(
-                content.strip()
-            )  # Strip trailing newlines from content itself
-            md_block.append("```")
-
-            processed_files_content.append("\n".join(md_block))
-            processed_files_paths_relative.append(filepath_relative_std)
-
-        except UnicodeDecodeError:
-            if args.verbose:
-                print(
-                    f"Skipping file with encoding error (likely binary): {filepath_relative_std}",
-                    file=sys.stderr,
-                )
-        except Exception as e:
-            print(
-                f"Error processing file {filepath_relative_std}: {e}", file=sys.stderr
-            )
-
-    # --- 4. Output ---
-    final_output = "\n\n".join(
-        processed_files_content
-    )  # Two newlines between file blocks
+    candidate_files_abs.sort()
 
     if args.output:
+        # The output file is truncated before the candidates are read, so it
+        # must not end up among them.
+        if os.path.abspath(args.output) in candidate_files_abs:
+            candidate_files_abs.remove(os.path.abspath(args.output))
         try:
-            with open(args.output, "w", encoding="utf-8") as f:
-                f.write(final_output)
-            if args.verbose:
-                print(
-                    f"\nSuccessfully wrote {len(processed_files_paths_relative)} files to {args.output}",
-                    file=sys.stderr,
-                )
-            else:
-                # Non-verbose success message to stdout if not piping, stderr if piping
-                # This is tricky. Let's just print to stderr to avoid mixing with piped output.
-                if sys.stdout.isatty():
-                    print(
-                        f"Markdown content for {len(processed_files_paths_relative)} file(s) written to {args.output}"
-                    )
+            output_file = open(args.output, "w", encoding="utf-8")
         except IOError as e:
             print(f"Error writing to output file {args.output}: {e}", file=sys.stderr)
             sys.exit(1)
     else:
         # Output to stdout (for piping)
-        # Ensure final output ends with a newline if it's not empty
-        if final_output:
-            sys.stdout.write(final_output + "\n")
-        if (
-            args.verbose and sys.stderr.isatty()
-        ):  # Only print summary if stderr is a tty
+        output_file = sys.stdout
+
+    # Per-file work is independent, and the ignore structures are read-only by
+    # now, so files are filtered and read concurrently. Results are consumed in
+    # submission order to keep the output sorted. Only a window of files is
+    # submitted at a time, so an early exit doesn't wait for the whole queue.
+    max_workers = min(32, (os.cpu_count() or 1) * 4)
+    max_in_flight = max_workers * 4
+    # Bound once, as locals, since they are used for every file
+    project_root_prefix = os.path.join(project_root_abs, "")
+    verbose = args.verbose
+    write_output = output_file.write
+    # Picked once, so --no-gitignore runs don't check for a matcher per file
+    if gitignore_matcher is None:
+        process_candidate = functools.partial(
+            process_one,
+            project_root_prefix=project_root_prefix,
+            explicitly_ignored_paths_abs=explicitly_ignored_paths_abs,
+            max_file_bytes=max_file_bytes,
+        )
+    else:
+        process_candidate = functools.partial(
+            process_one_with_gitignore,
+            project_root_prefix=project_root_prefix,
+            explicitly_ignored_paths_abs=explicitly_ignored_paths_abs,
+            gitignore_matcher=gitignore_matcher,
+            max_file_bytes=max_file_bytes,
+        )
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            candidates = iter(candidate_files_abs)
+            # Each future is dropped once its block is written, so finished
+            # blocks don't pile up in memory until the end of the run
+            pending = collections.deque(
+                (filepath_abs, executor.submit(process_candidate, filepath_abs))
+                for filepath_abs in itertools.islice(candidates, max_in_flight)
+            )
+            try:
+                while pending:
+                    filepath_abs, future = pending.popleft()
+                    next_filepath_abs = next(candidates, None)
+                    if next_filepath_abs is not None:
+                        pending.append(
+                            (
+                                next_filepath_abs,
+                                executor.submit(process_candidate, next_filepath_abs),
+                            )
+                        )
+                    try:
+                        md_block, skip_message = future.result()
+                    except Exception as e:
+                        flush_skip_log()  # Keep messages in order
+                        filepath_relative_std = os.path.relpath(
+                            filepath_abs, project_root_abs
+                        ).replace(os.sep, "/")
+                        print(
+                            f"Error processing file {filepath_relative_std}: {e}",
+                            file=sys.stderr,
+                        )
+                        continue
+
+                    if md_block is None:
+                        if verbose:
+                            log_skip(skip_message)
+                        continue
+
+                    if processed_files_count:
+                        write_output("\n\n")  # Two newlines between file blocks
+                    write_output(md_block)
+                    processed_files_count += 1
+            except BaseException:
+                # Ctrl-C or a failed write: drop the queued files, so leaving
+                # the `with` block only waits for the ones already being read
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+
+        # Ensure stdout output ends with a newline if it's not empty
+        if not args.output and processed_files_count:
+            output_file.write("\n")
+    except BrokenPipeError:
+        # The reader of stdout went away (e.g. `stm | head`), stop quietly.
+        # stdout is pointed at devnull so the final flush at exit doesn't fail too.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    except IOError as e:
+        if args.output:
+            print(f"Error writing to output file {args.output}: {e}", file=sys.stderr)
+        else:
+            print(f"Error writing to stdout: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        flush_skip_log()
+        if args.output:
+            output_file.close()
+
+    # --- 4. Summary ---
+    if args.output:
+        if args.verbose:
             print(
-                f"\nProcessed {len(processed_files_paths_relative)} files.",
+                f"\nSuccessfully wrote {processed_files_count} files to {args.output}",
                 file=sys.stderr,
             )
+        else:
+            # Non-verbose success message to stdout if not piping, stderr if piping
+            # This is tricky. Let's just print to stderr to avoid mixing with piped output.
+            if sys.stdout.isatty():
+                print(
+                    f"Markdown content for {processed_files_count} file(s) written to {args.output}"
+                )
+    elif args.verbose and sys.stderr.isatty():  # Only print summary if stderr is a tty
+        print(
+            f"\nProcessed {processed_files_count} files.",
+            file=sys.stderr,
+        )
 
 
 if __name__ == "__main__":